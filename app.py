@@ -1,330 +1,481 @@
-import streamlit as st
-import pandas as pd
-import pdfplumber
-import re
-import gspread
-from google.oauth2.service_account import Credentials
-import plotly.express as px
-
-# --- CONFIGURACIÓN DE PÁGINA ---
-st.set_page_config(page_title="Finanzas Familiares", page_icon="💰", layout="wide")
-
-# ==========================================
-# 1. CONEXIÓN A GOOGLE SHEETS
-# ==========================================
-@st.cache_resource
-def get_gsheet_client():
-    """Conecta a Google usando los secretos de Streamlit Cloud"""
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    try:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        return gspread.authorize(credentials)
-    except Exception as e:
-        st.error(f"❌ Error de credenciales: {e}")
-        return None
-
-def save_to_gsheet(df_new, sheet_name):
-    """Guarda datos nuevos evitando duplicados exactos"""
-    client = get_gsheet_client()
-    if not client: return 0
-    
-    try:
-        sh = client.open(sheet_name)
-        worksheet = sh.sheet1
-        
-        # Obtener datos existentes
-        existing_data = worksheet.get_all_records()
-        df_current = pd.DataFrame(existing_data)
-        
-        if df_current.empty:
-            df_combined = df_new
-        else:
-            # Estandarizar columnas para concatenar
-            df_combined = pd.concat([df_current, df_new], ignore_index=True)
-        
-        # Eliminar duplicados (Misma fecha, descripción y monto)
-        # Convertimos a string temporalmente para comparar bien
-        df_combined['Monto'] = df_combined['Monto'].astype(float)
-        df_final = df_combined.drop_duplicates(subset=['Fecha', 'Descripción', 'Monto'], keep='last')
-        
-        # Escribir todo de nuevo (método más seguro para datasets < 5000 filas)
-        worksheet.clear()
-        worksheet.update([df_final.columns.values.tolist()] + df_final.values.tolist())
-        
-        return len(df_final) - len(df_current)
-    except Exception as e:
-        st.error(f"Error escribiendo en Sheets: {e}")
-        return 0
-
-# ==========================================
-# 2. MOTORES DE EXTRACCIÓN (ETL)
-# ==========================================
-
-def parse_monto_chile(monto_str):
-    """Convierte '$ 1.250.000' a float 1250000.0"""
-    try:
-        clean = monto_str.replace('$', '').replace(' ', '')
-        # Formato CL: Puntos son miles, Coma es decimal (a veces)
-        # Eliminamos puntos de miles
-        clean = clean.replace('.', '')
-        # Reemplazamos coma decimal por punto (si hubiese centavos)
-        clean = clean.replace(',', '.')
-        return float(clean)
-    except:
-        return 0.0
-
-def extract_cmr_falabella(lines):
-    """
-    Estrategia específica para Estado de Cuenta CMR.
-    Filtra: Avances, Cuotas futuras y Resúmenes basura.
-    """
-    transactions = []
-    total_detected = 0.0
-    
-    # Regex 1: Busca transacciones reales (Fecha DD/MM/YY + Desc + Monto)
-    # Ej: 12/12/23 COMPRA SUPERMERCADO $ 20.000
-    rx_tx = re.compile(r'(\d{2}/\d{2}/\d{2,4})\s+(.+?)\s+(-?\$?\s?[\d\.,]+)')
-    
-    # Regex 2: Busca el "TOTAL A PAGAR" en el encabezado para validar
-    rx_total = re.compile(r'(TOTAL A PAGAR|MONTO TOTAL).*?(\$?\s?[\d\.,]+)')
-
-    for line in lines:
-        line_upper = line.upper()
-        
-        # A. Captura del Total del documento (para validación)
-        if total_detected == 0:
-            match_total = rx_total.search(line_upper)
-            if match_total:
-                total_detected = parse_monto_chile(match_total.group(2))
-
-        # B. FILTROS DE BASURA (Crucial para tu error anterior)
-        # Si la línea tiene "****" y NO dice COMPRA, es basura de la tarjeta
-        if "****" in line and "COMPRA" not in line_upper: continue
-        # Si es saldo anterior o pagos
-        if "SALDO ANTERIOR" in line_upper or "PAGO RECIBIDO" in line_upper: continue
-        # Si la descripción es demasiado corta (ej: "**** 0")
-        if len(line) < 15: continue
-        
-        # C. Extracción
-        match = rx_tx.search(line)
-        if match:
-            fecha = match.group(1)
-            desc = match.group(2).strip()
-            monto_str = match.group(3)
-            
-            # Filtro extra: Si la descripción es solo numeritos o asteriscos
-            if re.match(r'^[\*\s\d]+$', desc): continue
-
-            monto = parse_monto_chile(monto_str)
-            
-            # CMR muestra gastos en positivo. Los pasamos a negativo.
-            if monto > 0: monto = -1 * monto
-
-            transactions.append({
-                "Fecha": fecha,
-                "Descripción": desc,
-                "Monto": monto,
-                "Categoría": "Gasto General",
-                "Banco_Origen": "CMR Falabella"
-            })
-            
-    return transactions, total_detected
-
-def extract_banco_generico(lines, banco_name):
-    """Para BCI y Santander (Formato Cartola)"""
-    transactions = []
-    # Regex típica cartola: Fecha DD/MM/YY o DD-MM-YY + Desc + Monto
-    rx = re.compile(r'(\d{2}[/-]\d{2}[/-]\d{2,4})\s+(.+?)\s+(-?[\d\.]+)')
-    
-    for line in lines:
-        match = rx.search(line)
-        if match:
-            try:
-                monto = parse_monto_chile(match.group(3))
-                desc = match.group(2).strip()
-                # Filtrar saldos acumulados si aparecen como línea
-                if "SALDO" in desc.upper(): continue
-                
-                transactions.append({
-                    "Fecha": match.group(1),
-                    "Descripción": desc,
-                    "Monto": monto,
-                    "Categoría": "Gasto General",
-                    "Banco_Origen": banco_name
-                })
-            except: continue
-    return transactions, 0.0 # BCI/Santander es dificil sacar el total del PDF para validar
-
-def extract_sueldo_samsonite(lines):
-    """Busca Liquidación de Sueldo"""
-    transactions = []
-    found = False
-    for line in lines:
-        if "LÍQUIDO A PAGO" in line.upper() or "A PAGAR" in line.upper():
-            # Buscar el último número de la línea
-            numeros = re.findall(r'[\d\.]+', line.replace(',', '.')) # simplificado
-            if numeros:
-                # El ultimo numero suele ser el monto final
-                monto = parse_monto_chile(numeros[-1])
-                transactions.append({
-                    "Fecha": pd.Timestamp.now().strftime("%d/%m/%Y"), # Fecha hoy
-                    "Descripción": "Sueldo Samsonite",
-                    "Monto": abs(monto), # Ingreso es positivo
-                    "Categoría": "Ingreso Familiar",
-                    "Banco_Origen": "Liquidación"
-                })
-                found = True
-                break
-    return transactions, 0.0
-
-def process_pdf(file):
-    with pdfplumber.open(file) as pdf:
-        full_text = ""
-        for page in pdf.pages:
-            full_text += page.extract_text() + "\n"
-        
-        lines = full_text.split('\n')
-        lower_text = full_text.lower()
-        
-        # DETECTOR DE BANCO
-        if "falabella" in lower_text or "cmr" in lower_text:
-            return extract_cmr_falabella(lines)
-        elif "santander" in lower_text:
-            return extract_banco_generico(lines, "Banco Santander")
-        elif "bci" in lower_text:
-            return extract_banco_generico(lines, "Banco BCI")
-        elif "samsonite" in lower_text or "liquidacion" in lower_text:
-            return extract_sueldo_samsonite(lines)
-        else:
-            return [], 0.0
-
-# ==========================================
-# 3. LÓGICA DE NEGOCIO (Tus Reglas)
-# ==========================================
-def apply_rules(df):
-    if df.empty: return df
-    
-    def categorize(row):
-        desc = str(row['Descripción']).upper()
-        banco = str(row['Banco_Origen']).upper()
-        
-        # Reglas Prioritarias
-        if "LIQUIDACIÓN" in banco: return "Ingreso Familiar"
-        if "MARCELA CONTRERAS" in desc: return "Ingreso Familiar" # ¿O transferencia a ella? Ajustar según necesidad
-        if "MARCELO CONTRERAS" in desc: return "Arriendo"
-        if "EDIPRO" in desc or "CAROL URZUA" in desc: return "Gastos Comunes"
-        if "TOTUS" in desc or "LIDER" in desc or "JUMBO" in desc: return "Supermercado"
-        
-        return row['Categoría'] # Mantiene default
-
-    df['Categoría'] = df.apply(categorize, axis=1)
-    return df
-
-# ==========================================
-# 4. INTERFAZ GRÁFICA (MAIN)
-# ==========================================
-
-st.title("🏡 Finanzas Familiares: Gestor Inteligente")
-st.markdown("---")
-
-col_upl, col_stat = st.columns([1, 2])
-
-with col_upl:
-    st.subheader("1. Subir Documentos")
-    uploaded_files = st.file_uploader(
-        "Arrastra tus PDFs (Bancos/Sueldo)", 
-        type="pdf", 
-        accept_multiple_files=True
-    )
-
-if uploaded_files:
-    all_txs = []
-    
-    st.subheader("2. Validación de Extracción")
-    
-    for pdf in uploaded_files:
-        try:
-            txs, total_pdf = process_pdf(pdf)
-            
-            if txs:
-                df_temp = pd.DataFrame(txs)
-                suma_txs = df_temp['Monto'].sum()
-                
-                # --- WIDGET DE VALIDACIÓN ---
-                # Comparamos valor absoluto para evitar líos de signos
-                diff = abs(abs(total_pdf) - abs(suma_txs))
-                is_valid = diff < 2000 # Tolerancia $2.000 pesos
-                
-                icon = "✅" if (is_valid or total_pdf == 0) else "⚠️"
-                
-                with st.expander(f"{icon} {pdf.name} (Total PDF: ${total_pdf:,.0f})"):
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("Total Detectado", f"${total_pdf:,.0f}")
-                    c2.metric("Suma Extraída", f"${abs(suma_txs):,.0f}")
-                    
-                    if total_pdf > 0 and not is_valid:
-                        c3.error(f"Diferencia: ${diff:,.0f}")
-                        st.warning("La suma de gastos no cuadra con el total del estado de cuenta. Revisa si falta algo.")
-                    else:
-                        c3.success("Cuadratura OK")
-                
-                all_txs.extend(txs)
-            else:
-                st.warning(f"⚠️ No se encontraron datos en {pdf.name}")
-
-        except Exception as e:
-            st.error(f"Error procesando {pdf.name}: {e}")
-
-    # --- ETAPA FINAL: EDICIÓN Y GUARDADO ---
-    if all_txs:
-        df_final = pd.DataFrame(all_txs)
-        df_final = apply_rules(df_final)
-        
-        st.divider()
-        st.subheader("3. Revisión Final y Guardado")
-        
-        # Editor Editable
-        edited_df = st.data_editor(
-            df_final, 
-            num_rows="dynamic",
-            use_container_width=True,
-            column_config={
-                "Monto": st.column_config.NumberColumn(format="$%d"),
-                "Fecha": st.column_config.TextColumn(),
-                "Categoría": st.column_config.SelectboxColumn(
-                    options=["Gasto General", "Supermercado", "Arriendo", "Gastos Comunes", "Ingreso Familiar", "Servicios", "Transporte"]
-                )
-            }
-        )
-        
-        # Botón de Guardado
-        col_btn, col_graph = st.columns([1, 3])
-        
-        with col_btn:
-            st.write("") # Espacio
-            st.write("") 
-            if st.button("💾 Guardar en Google Sheets", type="primary"):
-                with st.spinner("Sincronizando..."):
-                    added = save_to_gsheet(edited_df, "Finanzas_Master_DB")
-                    if added >= 0:
-                        st.balloons()
-                        st.success(f"¡Listo! Se agregaron {added} transacciones nuevas.")
-                    else:
-                        st.error("Hubo un problema al guardar.")
-        
-        with col_graph:
-            # Mini Dashboard instantáneo
-            gastos = edited_df[edited_df['Monto'] < 0].copy()
-            if not gastos.empty:
-                gastos['Monto_Abs'] = gastos['Monto'].abs()
-                fig = px.pie(gastos, values='Monto_Abs', names='Categoría', hole=0.4, title="Previsualización de Gastos")
-                fig.update_layout(height=300, margin=dict(t=30, b=0, l=0, r=0))
-                st.plotly_chart(fig, use_container_width=True)
-
-else:
-    # Mensaje de bienvenida
-    st.info("👆 Sube tus PDFs en la barra lateral para comenzar.")
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+import pymupdf
+try:
+    import regex as re # soporta cuantificadores posesivos en cualquier Python
+except ImportError:
+    import re # desde 3.11 el stdlib también los soporta
+import gspread
+from google.oauth2.service_account import Credentials
+import plotly.express as px
+
+try:
+    import ahocorasick # acelera la detección de banco; opcional
+except ImportError:
+    ahocorasick = None
+
+# --- CONFIGURACIÓN DE PÁGINA ---
+st.set_page_config(page_title="Finanzas Familiares", page_icon="💰", layout="wide")
+
+# --- REGEX PRE-COMPILADAS (evitar recompilar/buscar en cache por cada línea) ---
+# Transacción CMR: Fecha DD/MM/YY + Desc + Monto. Ej: 12/12/23 COMPRA SUPERMERCADO $ 20.000
+# Ancladas a inicio de línea (re.M): una sola pasada finditer sobre el texto
+# completo en vez de un re.search por línea; group(0) entrega la línea para filtrar
+_RX_CMR_TX = re.compile(r'^.*?(\d{2}/\d{2}/\d{2,4})\s++(.+?)\s++(-?\$?\s?[\d\.,]++)', re.M)
+# "TOTAL A PAGAR" en el encabezado CMR (para validar cuadratura)
+_RX_TOTAL = re.compile(r'(TOTAL A PAGAR|MONTO TOTAL).*?(\$?\s?[\d\.,]+)', re.I)
+# Cartola genérica (BCI/Santander): Fecha DD/MM/YY o DD-MM-YY + Desc + Monto
+# Cuantificadores posesivos (\s++, [..]++): el motor no re-intenta dentro de
+# espacios/números cuando una línea basura no calza, evitando backtracking N²
+_RX_GEN = re.compile(r'^.*?(\d{2}[/-]\d{2}[/-]\d{2,4})\s++(.+?)\s++(-?[\d\.]++)', re.M)
+# Línea de "LÍQUIDO A PAGO" en liquidaciones de sueldo
+_RX_LIQUIDO = re.compile(r'L[ÍI]QUIDO A PAGO|A PAGAR', re.I)
+# Números sueltos (para rescatar el monto final de la liquidación)
+_RX_NUM = re.compile(r'[\d\.]+')
+# Líneas basura de CMR: saldos y pagos que no son transacciones
+_GARBAGE_TOKENS = ("SALDO ANTERIOR", "PAGO RECIBIDO")
+
+# Filas por request al subir a Sheets (límite de tamaño de la API)
+_UPLOAD_CHUNK = 1000
+
+# Tabla de limpieza de montos: una sola pasada en C sobre el string
+# ($ y espacios fuera, puntos de miles fuera, coma decimal -> punto)
+_MONTO_TRANS = str.maketrans({'$': None, ' ': None, '.': None, ',': '.'})
+
+# Palabras clave de detección de banco (en minúsculas) -> estrategia
+_BANK_KEYWORDS = [
+    ("falabella", "cmr"),
+    ("cmr", "cmr"),
+    ("santander", "santander"),
+    ("bci", "bci"),
+    ("samsonite", "sueldo"),
+    ("liquidacion", "sueldo"),
+]
+
+if ahocorasick:
+    # Autómata Aho-Corasick: un solo escaneo del texto para todas las
+    # palabras clave, en vez de un "in" por cada una
+    _BANK_AUTOMATON = ahocorasick.Automaton()
+    for _kw, _tag in _BANK_KEYWORDS:
+        _BANK_AUTOMATON.add_word(_kw, _tag)
+    _BANK_AUTOMATON.make_automaton()
+else:
+    _BANK_AUTOMATON = None
+
+def detect_banco(lower_text):
+    """Devuelve la estrategia de extracción según las palabras clave del texto"""
+    if _BANK_AUTOMATON is not None:
+        return next((tag for _, tag in _BANK_AUTOMATON.iter(lower_text)), None)
+    # Fallback sin pyahocorasick: un escaneo por palabra clave
+    for kw, tag in _BANK_KEYWORDS:
+        if kw in lower_text:
+            return tag
+    return None
+
+# ==========================================
+# 1. CONEXIÓN A GOOGLE SHEETS
+# ==========================================
+@st.cache_resource
+def get_gsheet_client():
+    """Conecta a Google usando los secretos de Streamlit Cloud"""
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive"
+    ]
+    try:
+        creds_dict = dict(st.secrets["gcp_service_account"])
+        credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+        return gspread.authorize(credentials)
+    except Exception as e:
+        st.error(f"❌ Error de credenciales: {e}")
+        return None
+
+def _read_df(worksheet):
+    """Baja la hoja completa como DataFrame"""
+    # get_all_values() es una sola llamada batch a la API
+    # (get_all_records hacía trabajo extra por fila en gspread antiguos)
+    values = worksheet.get_all_values()
+    if len(values) < 2:
+        return pd.DataFrame()
+    return pd.DataFrame(values[1:], columns=values[0])
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_master_db(sheet_name):
+    """Lee la base maestra completa desde Sheets (cacheado 5 min)"""
+    client = get_gsheet_client()
+    if not client: return pd.DataFrame()
+    return _read_df(client.open(sheet_name).sheet1)
+
+def save_to_gsheet(df_new, sheet_name):
+    """Guarda datos nuevos evitando duplicados exactos"""
+    client = get_gsheet_client()
+    if not client: return 0
+
+    try:
+        sh = client.open(sheet_name)
+        worksheet = sh.sheet1
+
+        # Obtener datos existentes reutilizando la hoja ya abierta
+        # (abrir de nuevo vía load_master_db costaría un roundtrip extra)
+        df_current = _read_df(worksheet)
+
+        df_new = df_new.copy()
+        df_new['Monto'] = df_new['Monto'].astype(float)
+
+        if df_current.empty:
+            # Hoja vacía: escribir solo el encabezado; las filas van abajo
+            # por el mismo camino batcheado que el caso normal
+            df_delta = df_new.drop_duplicates(subset=['Fecha', 'Descripción', 'Monto'])
+            worksheet.update(values=[df_delta.columns.values.tolist()],
+                             range_name='A1', value_input_option='RAW')
+        else:
+            # Detectar duplicados (Misma fecha, descripción y monto) con un set
+            # de llaves: O(filas nuevas) en lookups, sin concatenar ambos frames
+            existing_keys = set(zip(df_current['Fecha'], df_current['Descripción'],
+                                    df_current['Monto'].astype(float)))
+            mask = []
+            for key in zip(df_new['Fecha'], df_new['Descripción'], df_new['Monto']):
+                if key in existing_keys:
+                    mask.append(False)
+                else:
+                    existing_keys.add(key) # evita duplicados dentro del mismo lote
+                    mask.append(True)
+            df_delta = df_new[mask]
+
+        # Solo agregar el delta: el costo escala con las filas nuevas, no con
+        # el tamaño total de la base. RAW evita el parsing de valores en el
+        # servidor y los lotes de 1000 filas respetan el límite por request.
+        rows = df_delta.values.tolist()
+        for i in range(0, len(rows), _UPLOAD_CHUNK):
+            worksheet.append_rows(rows[i:i + _UPLOAD_CHUNK], value_input_option='RAW')
+
+        # La hoja cambió: invalidar el cache de lectura
+        load_master_db.clear()
+
+        return len(df_delta)
+    except Exception as e:
+        st.error(f"Error escribiendo en Sheets: {e}")
+        return 0
+
+# ==========================================
+# 2. MOTORES DE EXTRACCIÓN (ETL)
+# ==========================================
+
+def parse_monto_chile(monto_str):
+    """Convierte '$ 1.250.000' a float 1250000.0"""
+    try:
+        return float(monto_str.translate(_MONTO_TRANS))
+    except (ValueError, AttributeError):
+        return 0.0
+
+def parse_monto_series(montos):
+    """Versión vectorizada de parse_monto_chile para una columna completa"""
+    clean = montos.astype(str).str.replace(r'[\$\s\.]', '', regex=True) \
+                              .str.replace(',', '.', regex=False)
+    return pd.to_numeric(clean, errors='coerce').fillna(0.0)
+
+def finalize_montos(df):
+    """Convierte la columna Monto (strings crudos del PDF) a float de una vez,
+    aplicando el signo según el origen"""
+    if df.empty: return df
+    df['Monto'] = parse_monto_series(df['Monto'])
+    # CMR muestra gastos en positivo. Los pasamos a negativo.
+    cmr = df['Banco_Origen'] == 'CMR Falabella'
+    df.loc[cmr, 'Monto'] = -df.loc[cmr, 'Monto'].abs()
+    # Liquidación de sueldo es ingreso: siempre positivo
+    liq = df['Banco_Origen'] == 'Liquidación'
+    df.loc[liq, 'Monto'] = df.loc[liq, 'Monto'].abs()
+    return df
+
+def extract_cmr_falabella(text):
+    """
+    Estrategia específica para Estado de Cuenta CMR.
+    Filtra: Avances, Cuotas futuras y Resúmenes basura.
+    """
+    transactions = []
+
+    # A. Captura del Total del documento (para validación): una búsqueda global
+    match_total = _RX_TOTAL.search(text)
+    total_detected = parse_monto_chile(match_total.group(2)) if match_total else 0.0
+
+    # B+C. Una sola pasada finditer: el motor C recorre el texto completo,
+    # solo las líneas que calzan con el patrón llegan a Python
+    for match in _RX_CMR_TX.finditer(text):
+        line = match.group(0)
+        line_upper = line.upper()
+
+        # FILTROS DE BASURA (Crucial para tu error anterior)
+        # Si la línea tiene "****" y NO dice COMPRA, es basura de la tarjeta
+        if "****" in line and "COMPRA" not in line_upper: continue
+        # Si es saldo anterior o pagos
+        if any(tok in line_upper for tok in _GARBAGE_TOKENS): continue
+        # Si la descripción es demasiado corta (ej: "**** 0")
+        if len(line) < 15: continue
+
+        fecha = match.group(1)
+        desc = match.group(2).strip()
+        monto_str = match.group(3)
+
+        # Filtro extra: Si la descripción es solo numeritos o asteriscos
+        if not desc.strip(' *0123456789'): continue
+
+        # Monto queda como string crudo; finalize_montos lo convierte
+        # vectorizado (y aplica el signo negativo de los gastos CMR)
+        transactions.append({
+            "Fecha": fecha,
+            "Descripción": desc,
+            "Monto": monto_str,
+            "Categoría": "Gasto General",
+            "Banco_Origen": "CMR Falabella"
+        })
+
+    return transactions, total_detected
+
+def extract_banco_generico(text, banco_name):
+    """Para BCI y Santander (Formato Cartola)"""
+    transactions = []
+    for match in _RX_GEN.finditer(text):
+        desc = match.group(2).strip()
+        # Filtrar saldos acumulados si aparecen como línea
+        if "SALDO" in desc.upper(): continue
+
+        transactions.append({
+            "Fecha": match.group(1),
+            "Descripción": desc,
+            "Monto": match.group(3), # string crudo, ver finalize_montos
+            "Categoría": "Gasto General",
+            "Banco_Origen": banco_name
+        })
+    return transactions, 0.0 # BCI/Santander es dificil sacar el total del PDF para validar
+
+def extract_sueldo_samsonite(text):
+    """Busca Liquidación de Sueldo"""
+    transactions = []
+    match = _RX_LIQUIDO.search(text)
+    if match:
+        # Recuperar la línea completa que contiene el "LÍQUIDO A PAGO"
+        start = text.rfind('\n', 0, match.start()) + 1
+        end = text.find('\n', match.end())
+        line = text[start:end] if end != -1 else text[start:]
+
+        # Buscar el último número de la línea
+        numeros = _RX_NUM.findall(line.replace(',', '.')) # simplificado
+        if numeros:
+            # El ultimo numero suele ser el monto final
+            transactions.append({
+                "Fecha": pd.Timestamp.now().strftime("%d/%m/%Y"), # Fecha hoy
+                "Descripción": "Sueldo Samsonite",
+                "Monto": numeros[-1], # finalize_montos lo deja positivo
+                "Categoría": "Ingreso Familiar",
+                "Banco_Origen": "Liquidación"
+            })
+    return transactions, 0.0
+
+def process_pdf(file):
+    # PyMuPDF: solo necesitamos texto plano (sin tablas/líneas), y es un orden
+    # de magnitud más rápido que pdfplumber/pdfminer para eso
+    with pymupdf.open(stream=file.read(), filetype="pdf") as pdf:
+        banco = None
+        parts = []
+        for page in pdf:
+            txt = page.get_text("text")
+
+            # DETECTOR DE BANCO: en la misma pasada, solo hasta encontrarlo
+            # (evita concatenar y re-bajar a minúsculas el documento completo)
+            if banco is None:
+                banco = detect_banco(txt.lower())
+
+            parts.append(txt)
+
+        # Un solo join; los extractores recorren el texto con finditer,
+        # sin split por líneas ni loop Python por línea
+        text = "\n".join(parts)
+
+        if banco == "cmr":
+            return extract_cmr_falabella(text)
+        elif banco == "santander":
+            return extract_banco_generico(text, "Banco Santander")
+        elif banco == "bci":
+            return extract_banco_generico(text, "Banco BCI")
+        elif banco == "sueldo":
+            return extract_sueldo_samsonite(text)
+        else:
+            return [], 0.0
+
+def process_pdf_bytes(data):
+    """Versión picklable de process_pdf: recibe bytes crudos (para workers)"""
+    return process_pdf(io.BytesIO(data))
+
+# ==========================================
+# 3. LÓGICA DE NEGOCIO (Tus Reglas)
+# ==========================================
+def apply_rules(df):
+    if df.empty: return df
+
+    # Vectorizado: un solo upper() por columna y máscaras booleanas en C,
+    # en vez de llamar una función Python por cada fila (df.apply).
+    desc = df['Descripción'].astype(str).str.upper()
+    banco = df['Banco_Origen'].astype(str).str.upper()
+
+    # Reglas Prioritarias (el orden importa: la primera máscara que calza gana)
+    m_ingreso = banco.str.contains('LIQUIDACIÓN', regex=False) | \
+                desc.str.contains('MARCELA CONTRERAS', regex=False) # ¿O transferencia a ella? Ajustar según necesidad
+    m_arriendo = desc.str.contains('MARCELO CONTRERAS', regex=False)
+    m_gcomunes = desc.str.contains('EDIPRO|CAROL URZUA', regex=True)
+    m_super = desc.str.contains('TOTUS|LIDER|JUMBO', regex=True)
+
+    df['Categoría'] = np.select(
+        [m_ingreso, m_arriendo, m_gcomunes, m_super],
+        ['Ingreso Familiar', 'Arriendo', 'Gastos Comunes', 'Supermercado'],
+        default=df['Categoría'] # Mantiene default
+    )
+    return df
+
+# ==========================================
+# 4. INTERFAZ GRÁFICA (MAIN)
+# ==========================================
+
+st.title("🏡 Finanzas Familiares: Gestor Inteligente")
+st.markdown("---")
+
+col_upl, col_stat = st.columns([1, 2])
+
+with col_upl:
+    st.subheader("1. Subir Documentos")
+    uploaded_files = st.file_uploader(
+        "Arrastra tus PDFs (Bancos/Sueldo)", 
+        type="pdf", 
+        accept_multiple_files=True
+    )
+
+if uploaded_files:
+    all_txs = []
+    
+    st.subheader("2. Validación de Extracción")
+
+    # Cache por hash del archivo: Streamlit re-ejecuta el script completo en
+    # cada interacción, y sin esto cada edición re-parseaba todos los PDFs
+    parse_cache = st.session_state.setdefault("pdf_parse_cache", {})
+    datas = [pdf.getvalue() for pdf in uploaded_files]
+    keys = [hashlib.sha1(data).hexdigest() for data in datas]
+    pending = [i for i, key in enumerate(keys) if key not in parse_cache]
+
+    # Cada PDF es independiente y el parseo es CPU-bound: con varios archivos
+    # nuevos los parseamos en paralelo (un proceso por PDF)
+    executor = None
+    futures = {}
+    if len(pending) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1))
+        futures = {i: executor.submit(process_pdf_bytes, datas[i]) for i in pending}
+
+    for idx, pdf in enumerate(uploaded_files):
+        try:
+            if keys[idx] in parse_cache:
+                txs, total_pdf = parse_cache[keys[idx]]
+            else:
+                if idx in futures:
+                    txs, total_pdf = futures[idx].result()
+                else:
+                    txs, total_pdf = process_pdf_bytes(datas[idx])
+                parse_cache[keys[idx]] = (txs, total_pdf)
+
+            if txs:
+                # Suma para la cuadratura sin armar un DataFrame por archivo:
+                # el DataFrame real se construye una sola vez desde all_txs
+                montos = parse_monto_series(pd.Series([t['Monto'] for t in txs]))
+                # Mismo signo que aplicará finalize_montos (un banco por archivo)
+                if txs[0]['Banco_Origen'] == 'CMR Falabella':
+                    suma_txs = -montos.abs().sum()
+                elif txs[0]['Banco_Origen'] == 'Liquidación':
+                    suma_txs = montos.abs().sum()
+                else:
+                    suma_txs = montos.sum()
+                
+                # --- WIDGET DE VALIDACIÓN ---
+                # Comparamos valor absoluto para evitar líos de signos
+                diff = abs(abs(total_pdf) - abs(suma_txs))
+                is_valid = diff < 2000 # Tolerancia $2.000 pesos
+                
+                icon = "✅" if (is_valid or total_pdf == 0) else "⚠️"
+                
+                with st.expander(f"{icon} {pdf.name} (Total PDF: ${total_pdf:,.0f})"):
+                    c1, c2, c3 = st.columns(3)
+                    c1.metric("Total Detectado", f"${total_pdf:,.0f}")
+                    c2.metric("Suma Extraída", f"${abs(suma_txs):,.0f}")
+                    
+                    if total_pdf > 0 and not is_valid:
+                        c3.error(f"Diferencia: ${diff:,.0f}")
+                        st.warning("La suma de gastos no cuadra con el total del estado de cuenta. Revisa si falta algo.")
+                    else:
+                        c3.success("Cuadratura OK")
+                
+                all_txs.extend(txs)
+            else:
+                st.warning(f"⚠️ No se encontraron datos en {pdf.name}")
+
+        except Exception as e:
+            st.error(f"Error procesando {pdf.name}: {e}")
+
+    if executor:
+        executor.shutdown()
+
+    # --- ETAPA FINAL: EDICIÓN Y GUARDADO ---
+    if all_txs:
+        df_final = finalize_montos(pd.DataFrame(all_txs))
+        df_final = apply_rules(df_final)
+        
+        st.divider()
+        st.subheader("3. Revisión Final y Guardado")
+        
+        # Editor Editable dentro de un form: las ediciones de celdas se
+        # acumulan en el navegador y el script solo se re-ejecuta al Guardar
+        with st.form("revision_guardado"):
+            edited_df = st.data_editor(
+                df_final,
+                num_rows="dynamic",
+                use_container_width=True,
+                column_config={
+                    "Monto": st.column_config.NumberColumn(format="$%d"),
+                    "Fecha": st.column_config.TextColumn(),
+                    "Categoría": st.column_config.SelectboxColumn(
+                        options=["Gasto General", "Supermercado", "Arriendo", "Gastos Comunes", "Ingreso Familiar", "Servicios", "Transporte"]
+                    )
+                }
+            )
+            submitted = st.form_submit_button("💾 Guardar en Google Sheets", type="primary")
+
+        col_btn, col_graph = st.columns([1, 3])
+
+        with col_btn:
+            if submitted:
+                with st.spinner("Sincronizando..."):
+                    added = save_to_gsheet(edited_df, "Finanzas_Master_DB")
+                    if added >= 0:
+                        st.balloons()
+                        st.success(f"¡Listo! Se agregaron {added} transacciones nuevas.")
+                    else:
+                        st.error("Hubo un problema al guardar.")
+
+        with col_graph:
+            # Mini Dashboard instantáneo
+            # Proyectar solo las dos columnas del gráfico: evita copiar
+            # el frame completo (y los warnings de chained assignment)
+            gastos = edited_df.loc[edited_df['Monto'] < 0, ['Categoría', 'Monto']]
+            if not gastos.empty:
+                # Agregar por categoría antes de graficar: al navegador viajan
+                # K categorías en vez de N filas
+                agg = gastos['Monto'].abs().groupby(gastos['Categoría']).sum() \
+                                     .reset_index(name='Monto_Abs')
+                fig = px.pie(agg, values='Monto_Abs', names='Categoría', hole=0.4, title="Previsualización de Gastos")
+                fig.update_layout(height=300, margin=dict(t=30, b=0, l=0, r=0))
+                st.plotly_chart(fig, use_container_width=True)
+
+else:
+    # Mensaje de bienvenida
+    st.info("👆 Sube tus PDFs en la barra lateral para comenzar.")